@@ -1,24 +1,14 @@
 from datetime import datetime
-from enum import Enum
 from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
 from pydantic_ai.messages import ModelRequestPart, ModelResponsePart
 
+from app.db.maintenance import JobMetrics, MaintenanceReport
+from app.entities.message import MessageRole, render_part
 from app.entities.thread import Thread
-
-
-class MessageRole(str, Enum):
-    """Enumeration for message roles in the chat system."""
-
-    SYSTEM = "system"
-    USER = "user"
-    ASSISTANT = "assistant"
-    THINKING = "thinking"
-    TOOLCALL = "tool-call"
-    TOOLRETURN = "tool-return"
-    RETRY = "retry"
+from app.entities.usage import UsageSummary
 
 
 class MessageDto(BaseModel):
@@ -31,29 +21,7 @@ class MessageDto(BaseModel):
     @classmethod
     def from_part(cls, part: ModelRequestPart | ModelResponsePart) -> "MessageDto":
         """Create a MessageDto from a Pydantic AI message part."""
-        if part.part_kind == "system-prompt":
-            role = MessageRole.SYSTEM
-        elif part.part_kind == "user-prompt":
-            role = MessageRole.USER
-        elif part.part_kind == "text":
-            role = MessageRole.ASSISTANT
-        elif part.part_kind == "thinking":
-            role = MessageRole.THINKING
-        elif part.part_kind == "tool-call":
-            role = MessageRole.TOOLCALL
-        elif part.part_kind == "tool-return":
-            role = MessageRole.TOOLRETURN
-        elif part.part_kind == "retry-prompt":
-            role = MessageRole.RETRY
-
-        content = None
-        if part.part_kind == "tool-call":
-            content = f"Tool call: {part.tool_name} with args {part.args}"
-        elif part.part_kind == "tool-return":
-            content = f"{part.tool_name}: {part.content}"
-        elif hasattr(part, "content") and part.content is not None:
-            content = str(part.content)
-
+        role, content = render_part(part)
         return cls(
             role=role,
             content=content,
@@ -84,3 +52,90 @@ class ThreadDto(BaseModel):
             updated_at=thread.updated_at,
             messages=messages,
         )
+
+    @classmethod
+    def render_json(cls, thread: Thread, rendered_messages: list[str]) -> bytes:
+        """Serialize a thread straight to JSON from pre-rendered message arrays.
+
+        Each item of `rendered_messages` is the JSON array stored alongside a
+        message row, so the parts never go through pydantic-ai or MessageDto.
+        """
+        header = cls(
+            id=thread.id,
+            title=thread.title,
+            created_at=thread.created_at,
+            updated_at=thread.updated_at,
+        ).model_dump_json(exclude={"messages"})
+        items = ",".join(
+            rendered[1:-1] for rendered in rendered_messages if rendered != "[]"
+        )
+        return f'{header[:-1]},"messages":[{items}]}}'.encode()
+
+
+class UsageSummaryDto(BaseModel):
+    thread_id: UUID | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    turns: int
+    requests: int
+    request_tokens: int
+    response_tokens: int
+    total_tokens: int
+    tool_calls: int
+    latency_ms: float
+
+    @classmethod
+    def from_summary(
+        cls,
+        summary: UsageSummary,
+        thread_id: UUID | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> "UsageSummaryDto":
+        """Create a UsageSummaryDto from a UsageSummary entity."""
+        return cls(
+            thread_id=thread_id,
+            since=since,
+            until=until,
+            turns=summary.turns,
+            requests=summary.requests,
+            request_tokens=summary.request_tokens,
+            response_tokens=summary.response_tokens,
+            total_tokens=summary.total_tokens,
+            tool_calls=summary.tool_calls,
+            latency_ms=summary.latency_ms,
+        )
+
+
+class JobMetricsDto(BaseModel):
+    job: str
+    started_at: datetime
+    duration_ms: float
+    threads: int
+    messages: int
+    bytes_written: int
+    bytes_reclaimed: int
+    error: str | None = None
+
+    @classmethod
+    def from_metrics(cls, metrics: JobMetrics) -> "JobMetricsDto":
+        """Create a JobMetricsDto from a maintenance job's metrics."""
+        return cls(
+            job=metrics.job,
+            started_at=metrics.started_at,
+            duration_ms=metrics.duration_ms,
+            threads=metrics.threads,
+            messages=metrics.messages,
+            bytes_written=metrics.bytes_written,
+            bytes_reclaimed=metrics.bytes_reclaimed,
+            error=metrics.error,
+        )
+
+
+class MaintenanceReportDto(BaseModel):
+    jobs: List[JobMetricsDto]
+
+    @classmethod
+    def from_report(cls, report: MaintenanceReport) -> "MaintenanceReportDto":
+        """Create a MaintenanceReportDto from the latest maintenance report."""
+        return cls(jobs=[JobMetricsDto.from_metrics(job) for job in report.jobs])
@@ -0,0 +1,89 @@
+import os
+import random
+from collections.abc import Sequence
+from functools import cache
+from typing import Any, Literal
+
+from openai import APIConnectionError, AsyncOpenAI
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.models import Model
+from pydantic_ai.models.fallback import FallbackModel
+from pydantic_ai.models.openai import (
+    OpenAIModel,
+    OpenAIModelSettings,
+    OpenAIResponsesModel,
+    OpenAIResponsesModelSettings,
+)
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from app.config.config import ModelEndpoint, settings
+
+TurnKind = Literal["user", "webhook"]
+
+# rate limits and server errors surface as ModelHTTPError, timeouts and
+# connection failures as the openai client's APIConnectionError
+FALLBACK_ON = (ModelHTTPError, APIConnectionError)
+
+
+@cache
+def _default_endpoints() -> tuple[ModelEndpoint, ...]:
+    if settings.openai_model == "gpt-4o":
+        return (ModelEndpoint(model="gpt-4o"),)
+    elif settings.openai_model == "o3":
+        return (ModelEndpoint(model="o3", responses_api=True, reasoning_effort="low"),)
+    else:
+        raise ValueError(f"Unsupported OpenAI model: {settings.openai_model}")
+
+
+@cache
+def _get_model(endpoint: ModelEndpoint) -> Model:
+    # cached so models (and their HTTP connection pools) are reused across turns
+    api_key = endpoint.api_key.get_secret_value() if endpoint.api_key else None
+    if api_key is None and endpoint.base_url is not None:
+        # local OpenAI-compatible servers often need no key, but the client does
+        api_key = os.environ.get("OPENAI_API_KEY", "api-key-not-set")
+    client_options: dict[str, Any] = {"max_retries": settings.model_max_retries}
+    if settings.model_timeout is not None:
+        # an explicit None would disable the client's default timeout
+        client_options["timeout"] = settings.model_timeout
+    client = AsyncOpenAI(base_url=endpoint.base_url, api_key=api_key, **client_options)
+    provider = OpenAIProvider(openai_client=client)
+
+    if endpoint.responses_api:
+        responses_settings = OpenAIResponsesModelSettings()
+        if endpoint.reasoning_effort is not None:
+            responses_settings["openai_reasoning_effort"] = endpoint.reasoning_effort
+            responses_settings["openai_reasoning_summary"] = "detailed"
+        return OpenAIResponsesModel(
+            endpoint.model, provider=provider, settings=responses_settings
+        )
+
+    chat_settings = OpenAIModelSettings()
+    if endpoint.reasoning_effort is not None:
+        chat_settings["openai_reasoning_effort"] = endpoint.reasoning_effort
+    return OpenAIModel(endpoint.model, provider=provider, settings=chat_settings)
+
+
+def _weighted_order(endpoints: Sequence[ModelEndpoint]) -> list[ModelEndpoint]:
+    """Order endpoints by weighted random sampling without replacement."""
+    remaining = list(endpoints)
+    ordered = []
+    while remaining:
+        endpoint = random.choices(remaining, weights=[e.weight for e in remaining])[0]
+        remaining.remove(endpoint)
+        ordered.append(endpoint)
+    return ordered
+
+
+def route_model(kind: TurnKind) -> Model:
+    """Pick the model for a turn, falling back through the rest of its pool."""
+    endpoints: Sequence[ModelEndpoint] = settings.user_models
+    if kind == "webhook" and settings.webhook_models:
+        endpoints = settings.webhook_models
+    if not endpoints:
+        endpoints = settings.user_models or _default_endpoints()
+
+    models = [_get_model(endpoint) for endpoint in _weighted_order(endpoints)]
+    if len(models) == 1:
+        return models[0]
+    return FallbackModel(*models, fallback_on=FALLBACK_ON)
@@ -0,0 +1,176 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Annotated, Protocol
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.config import RateLimit, settings
+from app.db.crud import RateLimitCRUD
+from app.db.database import get_async_session
+
+
+def _take(
+    tokens: float, updated_at: float, now: float, limit: RateLimit
+) -> tuple[float, float]:
+    """Refill a bucket up to `now` and try to take one token from it.
+
+    Returns the new token count and the seconds to wait before retrying
+    (0 when the token was taken).
+    """
+    tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.refill_per_second
+
+
+class RateLimitBackend(Protocol):
+    async def acquire(self, buckets: list[tuple[str, RateLimit]]) -> float:
+        """Take a token from every bucket or from none of them.
+
+        Returns 0 if admitted, else the longest retry delay of the buckets
+        that are empty.
+        """
+        ...
+
+
+class InMemoryRateLimitBackend:
+    """Per-process token buckets, for single-worker deployments."""
+
+    max_buckets = 10_000
+    # evict down to this size so a full table is not rebuilt on every acquire
+    low_water_buckets = 9_000
+
+    def __init__(self) -> None:
+        # key -> (tokens, updated_at, seconds until the bucket is full again),
+        # least recently used first
+        self._buckets: OrderedDict[str, tuple[float, float, float]] = OrderedDict()
+
+    async def acquire(self, buckets: list[tuple[str, RateLimit]]) -> float:
+        now = time.monotonic()
+        taken = []
+        retry_after = 0.0
+        for key, limit in buckets:
+            tokens, updated_at, _ = self._buckets.get(key, (limit.capacity, now, 0.0))
+            tokens, wait = _take(tokens, updated_at, now, limit)
+            retry_after = max(retry_after, wait)
+            full_after = (limit.capacity - tokens) / limit.refill_per_second
+            taken.append((key, tokens, full_after))
+        if retry_after > 0:
+            return retry_after
+
+        for key, tokens, full_after in taken:
+            self._buckets[key] = (tokens, now, full_after)
+            self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_buckets:
+            self._evict(now)
+        return 0.0
+
+    def _evict(self, now: float):
+        # buckets that have refilled completely carry no state worth keeping
+        self._buckets = OrderedDict(
+            (key, bucket)
+            for key, bucket in self._buckets.items()
+            if now - bucket[1] < bucket[2]
+        )
+        # if most buckets are still active, drop the least recently used ones
+        while len(self._buckets) > self.low_water_buckets:
+            self._buckets.popitem(last=False)
+
+
+class DatabaseRateLimitBackend:
+    """Token buckets stored in the database, shared by all workers."""
+
+    max_attempts = 3
+
+    def __init__(self, session: AsyncSession):
+        self._crud = RateLimitCRUD(session)
+
+    async def acquire(self, buckets: list[tuple[str, RateLimit]]) -> float:
+        for _ in range(self.max_attempts):
+            now = time.time()
+            taken = []
+            retry_after = 0.0
+            for key, limit in buckets:
+                bucket = await self._crud.get_bucket(key)
+                tokens, updated_at = bucket if bucket else (limit.capacity, now)
+                tokens, wait = _take(tokens, updated_at, now, limit)
+                retry_after = max(retry_after, wait)
+                full_at = now + (limit.capacity - tokens) / limit.refill_per_second
+                expected = bucket[1] if bucket else None
+                taken.append((key, tokens, full_at, expected))
+            if retry_after > 0:
+                return retry_after
+            if await self._crud.save_buckets(taken, now):
+                return 0.0
+        # lost every race to concurrent writers: the buckets are contended
+        return max(1 / limit.refill_per_second for _, limit in buckets)
+
+
+_memory_backend = InMemoryRateLimitBackend()
+
+
+async def get_rate_limit_backend(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> RateLimitBackend | None:
+    if settings.rate_limit_backend == "memory":
+        return _memory_backend
+    elif settings.rate_limit_backend == "database":
+        return DatabaseRateLimitBackend(session)
+    return None
+
+
+async def _admit(
+    backend: RateLimitBackend | None, buckets: list[tuple[str, RateLimit | None]]
+) -> None:
+    limited = [(key, limit) for key, limit in buckets if limit is not None]
+    if backend is None or not limited:
+        return
+    retry_after = await backend.acquire(limited)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def _agent_run_buckets(
+    request: Request, thread_id: UUID
+) -> list[tuple[str, RateLimit | None]]:
+    client = request.client.host if request.client else "unknown"
+    return [
+        (f"client:{client}", settings.client_rate_limit),
+        (f"thread:{thread_id}", settings.thread_rate_limit),
+    ]
+
+
+async def limit_agent_run(
+    request: Request,
+    thread_id: UUID,
+    backend: Annotated[RateLimitBackend | None, Depends(get_rate_limit_backend)],
+) -> None:
+    """Admit a request that will start an agent run, per client and thread."""
+    await _admit(backend, _agent_run_buckets(request, thread_id))
+
+
+async def limit_mcp_webhook(
+    request: Request,
+    thread_id: UUID,
+    mcp_name: str,
+    backend: Annotated[RateLimitBackend | None, Depends(get_rate_limit_backend)],
+) -> None:
+    """Admit a webhook call per MCP server name, client and thread.
+
+    All scopes are checked together, so a call rejected by one of them does
+    not spend the tokens of the others.
+    """
+    await _admit(
+        backend,
+        [
+            (f"mcp:{mcp_name}", settings.mcp_rate_limit),
+            *_agent_run_buckets(request, thread_id),
+        ],
+    )
@@ -0,0 +1,440 @@
+"""Record agent turns to on-disk traces and replay them offline.
+
+With `settings.record_dir` set, every turn run by `run_agent_with_thread`
+writes a gzipped JSON trace of its model responses and MCP tool calls with
+their timings. `replay_trace` feeds a trace back through stand-in model and
+tool servers, optionally under cProfile or pyinstrument:
+
+    python -m app.api.recording <trace.json.gz> --speed 10 --profile cprofile
+"""
+
+import argparse
+import asyncio
+import cProfile
+import dataclasses
+import gzip
+import json
+import pstats
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Literal
+from uuid import UUID
+
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.mcp import TOOL_SCHEMA_VALIDATOR
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.toolsets import AbstractToolset, ToolsetTool, WrapperToolset
+from pydantic_core import to_jsonable_python
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.config.config import settings
+
+TRACE_VERSION = 1
+
+Profiler = Literal["cprofile", "pyinstrument"]
+
+# set while replaying so replayed turns are not recorded again
+_replaying: ContextVar[bool] = ContextVar("_replaying", default=False)
+
+
+def _dump_response(response: ModelResponse) -> Any:
+    return ModelMessagesTypeAdapter.dump_python([response], mode="json")[0]
+
+
+def _load_response(data: Any) -> ModelResponse:
+    response = ModelMessagesTypeAdapter.validate_python([data])[0]
+    assert isinstance(response, ModelResponse)
+    return response
+
+
+@dataclass
+class TurnRecorder:
+    """Collects model and tool events of one agent turn."""
+
+    thread_id: UUID
+    user_prompt: str
+    system_prompt: str
+    message_history: list[ModelMessage]
+    started: float = field(default_factory=time.perf_counter)
+    tools: dict[str, dict] = field(default_factory=dict)
+    events: list[dict] = field(default_factory=list)
+
+    def _offset_ms(self, at: float) -> float:
+        return (at - self.started) * 1000
+
+    def add_model_event(self, started: float, response: ModelResponse):
+        self.events.append(
+            {
+                "type": "model",
+                "start_ms": self._offset_ms(started),
+                "duration_ms": (time.perf_counter() - started) * 1000,
+                "response": _dump_response(response),
+            }
+        )
+
+    def add_tool_event(
+        self, started: float, name: str, args: dict[str, Any], result: Any
+    ):
+        self.events.append(
+            {
+                "type": "tool",
+                "name": name,
+                "args": args,
+                "result": to_jsonable_python(result, fallback=str),
+                "start_ms": self._offset_ms(started),
+                "duration_ms": (time.perf_counter() - started) * 1000,
+            }
+        )
+
+    def to_trace(self) -> dict:
+        return {
+            "version": TRACE_VERSION,
+            "recorded_at": datetime.now().isoformat(),
+            "thread_id": str(self.thread_id),
+            "user_prompt": self.user_prompt,
+            "system_prompt": self.system_prompt,
+            "message_history": ModelMessagesTypeAdapter.dump_python(
+                self.message_history, mode="json"
+            ),
+            "tools": list(self.tools.values()),
+            "events": self.events,
+            "duration_ms": self._offset_ms(time.perf_counter()),
+        }
+
+    def save(self, record_dir: Path) -> Path:
+        record_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        path = record_dir / f"{self.thread_id}-{stamp}.json.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_trace(), f, ensure_ascii=False, separators=(",", ":"))
+        return path
+
+
+@dataclass(init=False)
+class RecordingModel(WrapperModel):
+    """Model wrapper that records every response with its latency."""
+
+    recorder: TurnRecorder
+
+    def __init__(self, wrapped: Model, recorder: TurnRecorder):
+        super().__init__(wrapped)
+        self.recorder = recorder
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        started = time.perf_counter()
+        response = await self.wrapped.request(
+            messages, model_settings, model_request_parameters
+        )
+        self.recorder.add_model_event(started, response)
+        return response
+
+
+@dataclass
+class RecordingToolset(WrapperToolset):
+    """Toolset wrapper that records tool definitions, calls and results."""
+
+    recorder: TurnRecorder = field(kw_only=True)
+
+    async def get_tools(self, ctx: RunContext) -> dict[str, ToolsetTool]:
+        tools = await self.wrapped.get_tools(ctx)
+        for name, tool in tools.items():
+            self.recorder.tools[name] = {
+                "definition": dataclasses.asdict(tool.tool_def),
+                "max_retries": tool.max_retries,
+            }
+        return tools
+
+    async def call_tool(
+        self, name: str, tool_args: dict[str, Any], ctx: RunContext, tool: ToolsetTool
+    ) -> Any:
+        started = time.perf_counter()
+        result = await self.wrapped.call_tool(name, tool_args, ctx, tool)
+        self.recorder.add_tool_event(started, name, tool_args, result)
+        return result
+
+
+def start_recording(
+    agent: Agent, thread_id: UUID, user_prompt: str, messages: list[ModelMessage]
+) -> TurnRecorder | None:
+    """Create a recorder for a turn if recording is enabled."""
+    if settings.record_dir is None or _replaying.get():
+        return None
+    return TurnRecorder(
+        thread_id=thread_id,
+        user_prompt=user_prompt,
+        system_prompt=agent._system_prompts[0],
+        message_history=list(messages),
+    )
+
+
+@contextmanager
+def recording(agent: Agent, recorder: TurnRecorder | None) -> Iterator[None]:
+    """Route the agent's model and toolsets through the recorder."""
+    if recorder is None:
+        yield
+        return
+    assert isinstance(agent.model, Model)
+    toolsets = [
+        RecordingToolset(toolset, recorder=recorder) for toolset in agent._user_toolsets
+    ]
+    with agent.override(model=RecordingModel(agent.model, recorder), toolsets=toolsets):
+        yield
+
+
+async def save_recording(recorder: TurnRecorder | None) -> Path | None:
+    if recorder is None or settings.record_dir is None:
+        return None
+    return await asyncio.to_thread(recorder.save, Path(settings.record_dir))
+
+
+def load_trace(path: Path) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        trace = json.load(f)
+    if trace.get("version") != TRACE_VERSION:
+        raise ValueError(f"Unsupported trace version: {trace.get('version')}")
+    return trace
+
+
+async def _wait(duration_ms: float, speed: float | None) -> float:
+    if speed is None:
+        return 0.0
+    delay = duration_ms / 1000 / speed
+    await asyncio.sleep(delay)
+    return delay * 1000
+
+
+class ReplayModel(Model):
+    """Stand-in model returning the recorded responses in order."""
+
+    def __init__(self, events: list[dict], model_name: str, speed: float | None):
+        super().__init__()
+        self._events = [event for event in events if event["type"] == "model"]
+        self._model_name = model_name
+        self._speed = speed
+        self.wait_ms = 0.0
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        if not self._events:
+            raise RuntimeError("Replay requested more model responses than recorded")
+        event = self._events.pop(0)
+        self.wait_ms += await _wait(event["duration_ms"], self._speed)
+        return _load_response(event["response"])
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    @property
+    def system(self) -> str:
+        return "replay"
+
+
+class ReplayToolset(AbstractToolset):
+    """Stand-in for the MCP servers, returning the recorded tool results."""
+
+    def __init__(self, tools: list[dict], events: list[dict], speed: float | None):
+        self._tools = tools
+        self._events = [event for event in events if event["type"] == "tool"]
+        self._speed = speed
+        self.wait_ms = 0.0
+
+    async def get_tools(self, ctx: RunContext) -> dict[str, ToolsetTool]:
+        return {
+            tool["definition"]["name"]: ToolsetTool(
+                toolset=self,
+                tool_def=ToolDefinition(**tool["definition"]),
+                max_retries=tool["max_retries"],
+                args_validator=TOOL_SCHEMA_VALIDATOR,
+            )
+            for tool in self._tools
+        }
+
+    async def call_tool(
+        self, name: str, tool_args: dict[str, Any], ctx: RunContext, tool: ToolsetTool
+    ) -> Any:
+        for i, event in enumerate(self._events):
+            if event["name"] == name:
+                self._events.pop(i)
+                self.wait_ms += await _wait(event["duration_ms"], self._speed)
+                return event["result"]
+        raise RuntimeError(f"Replay has no recorded result left for tool {name}")
+
+
+@dataclass
+class ReplayReport:
+    """Timings of a replayed turn, in milliseconds."""
+
+    recorded_ms: float
+    total_ms: float
+    load_ms: float
+    model_wait_ms: float
+    tool_wait_ms: float
+    # self time by area, from cProfile
+    breakdown_ms: dict[str, float] = field(default_factory=dict)
+    stats: pstats.Stats | None = None
+    profile_text: str | None = None
+
+
+_AREAS = [
+    ("crud", ("/app/db/", "/sqlalchemy/", "/aiosqlite/")),
+    (
+        "serialization",
+        ("/app/api/dtos.py", "/app/entities/", "/pydantic_core/", "/pydantic/"),
+    ),
+    ("agent", ("/pydantic_ai/", "/pydantic_graph/", "/opentelemetry/")),
+    ("event-loop", ("/asyncio/", "/selectors.py")),
+]
+
+
+def _attribute(stats: pstats.Stats) -> dict[str, float]:
+    """Sum cProfile self time per area of the code base."""
+    breakdown: dict[str, float] = {}
+    # Stats.stats is not in typeshed: (file, line, func) -> (cc, nc, tt, ct, callers)
+    for (filename, _, func), (_, _, tottime, _, _) in stats.stats.items():  # type: ignore[attr-defined]
+        area = "other"
+        if filename == "~" and ("select" in func or "poll" in func):
+            area = "event-loop"
+        for name, markers in _AREAS:
+            if any(marker in filename for marker in markers):
+                area = name
+                break
+        breakdown[area] = breakdown.get(area, 0.0) + tottime * 1000
+    return breakdown
+
+
+async def replay_trace(
+    path: Path, speed: float | None = 1.0, profiler: Profiler | None = None
+) -> ReplayReport:
+    """Replay a recorded turn against a scratch in-memory database.
+
+    `speed` scales the recorded model and tool latencies (2.0 is twice as
+    fast); None skips them so only local overhead remains.
+    """
+    # imported here: the router imports this module for recording
+    from app.api.router import run_agent_with_thread
+    from app.db.crud import ThreadCRUD, UsageCRUD
+    from app.db.database import Base
+
+    trace = load_trace(path)
+    history = ModelMessagesTypeAdapter.validate_python(trace["message_history"])
+    responses = [e for e in trace["events"] if e["type"] == "model"]
+    model_name = (
+        _load_response(responses[0]["response"]).model_name if responses else None
+    )
+    model = ReplayModel(trace["events"], model_name or "replay", speed)
+    toolset = ReplayToolset(trace["tools"], trace["events"], speed)
+    agent = Agent(model, system_prompt=trace["system_prompt"], toolsets=[toolset])
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    token = _replaying.set(True)
+    cprofile = pyinstrument = None
+    try:
+        async with session_maker() as session:
+            service, usage_service = ThreadCRUD(session), UsageCRUD(session)
+            thread = await service.create_thread("replay")
+            if history:
+                await service.add_messages_to_thread(thread.id, history)
+
+            if profiler == "cprofile":
+                cprofile = cProfile.Profile()
+                cprofile.enable()
+            elif profiler == "pyinstrument":
+                try:
+                    from pyinstrument import (  # type: ignore[import-not-found]
+                        Profiler as PyinstrumentProfiler,
+                    )
+                except ImportError as e:
+                    raise RuntimeError(
+                        "pyinstrument is not installed; use --profile cprofile"
+                    ) from e
+                pyinstrument = PyinstrumentProfiler(async_mode="enabled")
+                pyinstrument.start()
+
+            started = time.perf_counter()
+            loaded = await service.get_thread_by_id(thread.id)
+            assert loaded is not None
+            load_ms = (time.perf_counter() - started) * 1000
+            await run_agent_with_thread(
+                agent, thread.id, trace["user_prompt"], loaded, service, usage_service
+            )
+            total_ms = (time.perf_counter() - started) * 1000
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+        if pyinstrument is not None:
+            pyinstrument.stop()
+        _replaying.reset(token)
+        await engine.dispose()
+
+    report = ReplayReport(
+        recorded_ms=trace["duration_ms"],
+        total_ms=total_ms,
+        load_ms=load_ms,
+        model_wait_ms=model.wait_ms,
+        tool_wait_ms=toolset.wait_ms,
+    )
+    if cprofile is not None:
+        report.stats = pstats.Stats(cprofile)
+        report.breakdown_ms = _attribute(report.stats)
+    if pyinstrument is not None:
+        report.profile_text = pyinstrument.output_text()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded agent turn.")
+    parser.add_argument("trace", type=Path)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="latency speed-up factor; 0 skips recorded latencies",
+    )
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"])
+    parser.add_argument(
+        "--stats", type=Path, help="write raw cProfile stats to this file"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        replay_trace(args.trace, speed=args.speed or None, profiler=args.profile)
+    )
+    print(f"recorded: {report.recorded_ms:.1f} ms, replayed: {report.total_ms:.1f} ms")
+    print(f"thread load: {report.load_ms:.1f} ms")
+    print(f"model wait: {report.model_wait_ms:.1f} ms")
+    print(f"tool wait: {report.tool_wait_ms:.1f} ms")
+    for area, ms in sorted(report.breakdown_ms.items(), key=lambda item: -item[1]):
+        print(f"  {area}: {ms:.1f} ms")
+    if report.stats is not None and args.stats is not None:
+        report.stats.dump_stats(args.stats)
+    if report.profile_text:
+        print(report.profile_text)
+
+
+if __name__ == "__main__":
+    main()
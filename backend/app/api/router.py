@@ -1,17 +1,38 @@
+import logging
+import time
+from datetime import datetime
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+)
 from pydantic import Field
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.agent import Agent, initialize_agent
-from app.api.dtos import ThreadDto
-from app.db.crud import ThreadCRUD
+from app.api.dtos import MaintenanceReportDto, ThreadDto, UsageSummaryDto
+from app.api.rate_limit import limit_agent_run, limit_mcp_webhook
+from app.api.recording import recording, save_recording, start_recording
+from app.api.usage import (
+    TokenBudgetExceeded,
+    get_usage_limits,
+    turn_usage,
+)
+from app.db import maintenance
+from app.db.crud import ThreadCRUD, UsageCRUD
 from app.db.database import get_async_session
 from app.entities.thread import Thread
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/threads", tags=["threads"])
+maintenance_router = APIRouter(prefix="/maintenance", tags=["maintenance"])
 
 
 async def get_thread_crud(
@@ -20,6 +41,12 @@ async def get_thread_crud(
     return ThreadCRUD(session)
 
 
+async def get_usage_crud(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> UsageCRUD:
+    return UsageCRUD(session)
+
+
 @router.post("/", response_model=ThreadDto)
 async def create_thread(
     title: Annotated[str, Field(min_length=1, max_length=100)],
@@ -37,15 +64,73 @@ async def get_all_threads(
     return [ThreadDto.from_model(thread) for thread in threads]
 
 
+@router.get("/usage", response_model=list[UsageSummaryDto])
+async def get_usage_by_thread(
+    usage_service: Annotated[UsageCRUD, Depends(get_usage_crud)],
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    summaries = await usage_service.get_usage_by_thread(since=since, until=until)
+    return [
+        UsageSummaryDto.from_summary(summary, thread_id, since, until)
+        for thread_id, summary in summaries.items()
+    ]
+
+
+def _thread_etag(thread_id: UUID, updated_at: datetime, since: datetime | None) -> str:
+    # partial (since=) and full responses are different representations
+    cursor = "full" if since is None else f"since-{since.timestamp()}"
+    return f'"{thread_id}-{updated_at.timestamp()}-{cursor}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
 @router.get("/{thread_id}", response_model=ThreadDto)
 async def get_thread_by_id(
     thread_id: UUID,
     service: Annotated[ThreadCRUD, Depends(get_thread_crud)],
+    since: datetime | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    thread = await service.get_thread_by_id(thread_id)
+    """Fetch a thread; with `since`, only messages created after it are returned.
+
+    Clients can pass the `updated_at` of their previous response as `since`,
+    and its ETag as `If-None-Match` to get a 304 when nothing has changed.
+    """
+    thread = await service.get_thread_by_id(thread_id, include_messages=False)
     if thread is None:
         raise HTTPException(status_code=404, detail="Thread not found")
-    return ThreadDto.from_model(thread)
+    etag = _thread_etag(thread_id, thread.updated_at, since)
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    rendered_messages = await service.get_rendered_messages(
+        thread_id, since=since, until=thread.updated_at
+    )
+    return Response(
+        content=ThreadDto.render_json(thread, rendered_messages),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
+
+
+@router.get("/{thread_id}/usage", response_model=UsageSummaryDto)
+async def get_thread_usage(
+    thread_id: UUID,
+    usage_service: Annotated[UsageCRUD, Depends(get_usage_crud)],
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    summary = await usage_service.get_usage_summary(
+        thread_id=thread_id, since=since, until=until
+    )
+    return UsageSummaryDto.from_summary(summary, thread_id, since, until)
 
 
 @router.delete("/{thread_id}")
@@ -65,6 +150,7 @@ async def run_agent_with_thread(
     user_prompt: str,
     thread: Thread,
     service: ThreadCRUD,
+    usage_service: UsageCRUD,
 ):
     # overwrite system prompt
     system_prompt = agent._system_prompts[0]
@@ -75,48 +161,103 @@ async def run_agent_with_thread(
                     part.content = system_prompt
                     break
 
-    result = await agent.run(user_prompt, message_history=thread.messages)
+    # re-check the budget: other turns may have used it since the request
+    try:
+        usage_limits = await get_usage_limits(thread_id, usage_service)
+    except TokenBudgetExceeded as e:
+        logger.warning(f"Skipping agent turn: {e}")
+        return None
+
+    recorder = start_recording(agent, thread_id, user_prompt, thread.messages)
+    started = time.perf_counter()
+    run = None
+    try:
+        with recording(agent, recorder):
+            async with agent.iter(
+                user_prompt, message_history=thread.messages, usage_limits=usage_limits
+            ) as run:
+                async for _ in run:
+                    pass
+    finally:
+        # save the tokens spent even when the run failed or hit its limits
+        if run is not None:
+            latency_ms = (time.perf_counter() - started) * 1000
+            new_messages = run.ctx.state.message_history[len(thread.messages) :]
+            await usage_service.add_usage(
+                turn_usage(thread_id, run.usage(), new_messages, latency_ms)
+            )
+
+    result = run.result
+    assert result is not None
     await service.add_messages_to_thread(thread_id, result.new_messages())
+    await save_recording(recorder)
     return result.output
 
 
-@router.post("/{thread_id}/messages")
+@router.post("/{thread_id}/messages", dependencies=[Depends(limit_agent_run)])
 async def create_message(
     thread_id: UUID,
     user_prompt: str,
     service: Annotated[ThreadCRUD, Depends(get_thread_crud)],
+    usage_service: Annotated[UsageCRUD, Depends(get_usage_crud)],
     background_tasks: BackgroundTasks,
 ):
     thread = await service.get_thread_by_id(thread_id)
     if thread is None:
         raise HTTPException(status_code=404, detail="Thread not found")
+    try:
+        await get_usage_limits(thread_id, usage_service)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     try:
         agent = await initialize_agent(thread_id)
         background_tasks.add_task(
-            run_agent_with_thread, agent, thread_id, user_prompt, thread, service
+            run_agent_with_thread,
+            agent,
+            thread_id,
+            user_prompt,
+            thread,
+            service,
+            usage_service,
         )
         return {"message": "Request is being processed in the background"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
-@router.post("webhook/mcp")
+@router.post("webhook/mcp", dependencies=[Depends(limit_mcp_webhook)])
 async def webhook_handler(
     thread_id: UUID,
     mcp_name: str,
     content: str,
     service: Annotated[ThreadCRUD, Depends(get_thread_crud)],
+    usage_service: Annotated[UsageCRUD, Depends(get_usage_crud)],
     background_tasks: BackgroundTasks,
 ):
     thread = await service.get_thread_by_id(thread_id)
     if thread is None:
         raise HTTPException(status_code=404, detail="Thread not found")
     try:
-        agent = await initialize_agent(thread_id)
+        await get_usage_limits(thread_id, usage_service)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    try:
+        agent = await initialize_agent(thread_id, kind="webhook")
         prompt_json = f"{{'mcp_name': '{mcp_name}', 'content': '{content}'}}"
         background_tasks.add_task(
-            run_agent_with_thread, agent, thread_id, prompt_json, thread, service
+            run_agent_with_thread,
+            agent,
+            thread_id,
+            prompt_json,
+            thread,
+            service,
+            usage_service,
         )
         return {"message": "Request is being processed in the background"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+
+@maintenance_router.get("/", response_model=MaintenanceReportDto)
+async def get_maintenance_report():
+    return MaintenanceReportDto.from_report(maintenance.last_report)
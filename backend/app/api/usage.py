@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.usage import Usage, UsageLimits
+
+from app.config.config import settings
+from app.db.crud import UsageCRUD
+from app.entities.usage import TurnUsage
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a thread or the whole app has used up its token budget."""
+
+
+async def get_usage_limits(thread_id: UUID, usage_crud: UsageCRUD) -> UsageLimits:
+    """Build the usage limits for the next turn from the remaining budgets."""
+    since = None
+    if settings.token_budget_window_hours is not None:
+        since = datetime.now() - timedelta(hours=settings.token_budget_window_hours)
+
+    remaining: list[int] = []
+    if settings.thread_token_budget is not None:
+        used = await usage_crud.get_usage_summary(thread_id=thread_id, since=since)
+        remaining.append(settings.thread_token_budget - used.total_tokens)
+    if settings.global_token_budget is not None:
+        used = await usage_crud.get_usage_summary(since=since)
+        remaining.append(settings.global_token_budget - used.total_tokens)
+
+    total_tokens_limit = min(remaining) if remaining else None
+    if total_tokens_limit is not None and total_tokens_limit <= 0:
+        raise TokenBudgetExceeded(f"Token budget exhausted for thread {thread_id}")
+
+    return UsageLimits(
+        request_limit=settings.agent_request_limit,
+        total_tokens_limit=total_tokens_limit,
+    )
+
+
+def turn_usage(
+    thread_id: UUID,
+    usage: Usage,
+    new_messages: list[ModelMessage],
+    latency_ms: float,
+) -> TurnUsage:
+    """Collect usage for a turn, including one that stopped part way."""
+    model_name = None
+    tool_calls = 0
+    for message in new_messages:
+        if isinstance(message, ModelResponse):
+            model_name = message.model_name or model_name
+            tool_calls += sum(
+                1 for part in message.parts if part.part_kind == "tool-call"
+            )
+
+    return TurnUsage(
+        thread_id=thread_id,
+        model_name=model_name,
+        requests=usage.requests,
+        request_tokens=usage.request_tokens or 0,
+        response_tokens=usage.response_tokens or 0,
+        total_tokens=usage.total_tokens or 0,
+        tool_calls=tool_calls,
+        latency_ms=latency_ms,
+        created_at=datetime.now(),
+    )
@@ -1,6 +1,7 @@
 import logging
+from typing import Literal
 
-from pydantic import Field
+from pydantic import BaseModel, ConfigDict, Field, SecretStr
 from pydantic_settings import BaseSettings
 
 logger = logging.getLogger(__name__)
@@ -10,13 +11,102 @@ handler = logging.StreamHandler()
 logger.addHandler(handler)
 
 
+class ModelEndpoint(BaseModel):
+    """An OpenAI-compatible model endpoint in a routing pool."""
+
+    model_config = ConfigDict(frozen=True)
+
+    model: str = Field(description="Model name, e.g. gpt-4o or o3")
+    base_url: str | None = Field(
+        default=None, description="API base URL; set for local/compatible servers"
+    )
+    api_key: SecretStr | None = Field(
+        default=None, description="API key; defaults to OPENAI_API_KEY"
+    )
+    weight: float = Field(default=1.0, gt=0, description="Load-spreading weight")
+    responses_api: bool = Field(
+        default=False, description="Use the OpenAI Responses API for this model"
+    )
+    reasoning_effort: Literal["low", "medium", "high"] | None = Field(
+        default=None, description="Reasoning effort for reasoning models"
+    )
+
+
+class RateLimit(BaseModel):
+    """Token bucket parameters for one admission-control scope."""
+
+    capacity: float = Field(gt=0, description="Burst size in requests")
+    refill_per_second: float = Field(gt=0, description="Sustained request rate")
+
+
 class Settings(BaseSettings):
     """Application settings using pydantic-settings."""
 
     openai_model: str = Field(default="gpt-4o", description="OpenAI model name")
+    user_models: list[ModelEndpoint] = Field(
+        default_factory=list,
+        description="Model pool for user turns; defaults to openai_model",
+    )
+    webhook_models: list[ModelEndpoint] = Field(
+        default_factory=list,
+        description="Model pool for webhook-triggered turns; defaults to user_models",
+    )
+    model_timeout: float | None = Field(
+        default=None,
+        description="Per-request model timeout in seconds (None: client default)",
+    )
+    model_max_retries: int = Field(
+        default=2, description="Client retries before falling back to the next model"
+    )
     mcp_server_urls: list[str] = Field(
         default_factory=list, description="List of MCP server URLs"
     )
+    thread_token_budget: int | None = Field(
+        default=None, description="Max total tokens per thread in the budget window"
+    )
+    global_token_budget: int | None = Field(
+        default=None, description="Max total tokens across all threads in the window"
+    )
+    token_budget_window_hours: float | None = Field(
+        default=24.0,
+        description="Length of the budget window in hours (None for all time)",
+    )
+    agent_request_limit: int | None = Field(
+        default=50, description="Max model requests per agent turn"
+    )
+    rate_limit_backend: Literal["memory", "database"] | None = Field(
+        default="memory", description="Rate limiter backend (None disables it)"
+    )
+    client_rate_limit: RateLimit | None = Field(
+        default=RateLimit(capacity=20, refill_per_second=1.0),
+        description="Agent-run requests allowed per client",
+    )
+    thread_rate_limit: RateLimit | None = Field(
+        default=RateLimit(capacity=5, refill_per_second=0.2),
+        description="Agent-run requests allowed per thread",
+    )
+    mcp_rate_limit: RateLimit | None = Field(
+        default=RateLimit(capacity=10, refill_per_second=0.5),
+        description="Webhook requests allowed per MCP server name",
+    )
+    record_dir: str | None = Field(
+        default=None, description="Directory for agent-run traces (None disables)"
+    )
+    maintenance_interval_seconds: float | None = Field(
+        default=None, description="Interval between maintenance runs (None disables)"
+    )
+    archive_after_days: float | None = Field(
+        default=None, description="Archive and drop threads idle for this many days"
+    )
+    archive_dir: str = Field(
+        default="archive", description="Directory for compressed thread archives"
+    )
+    thread_retention_days: float | None = Field(
+        default=None, description="Delete threads idle for this many days"
+    )
+    maintenance_batch_size: int = Field(
+        default=100, description="Threads archived or deleted per batch"
+    )
 
     class Config:
         env_file = ".env"
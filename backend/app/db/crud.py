@@ -2,13 +2,16 @@ from datetime import datetime
 from uuid import UUID, uuid4
 
 from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.entities.message import render_messages
 from app.entities.thread import Thread
+from app.entities.usage import TurnUsage, UsageSummary
 
-from .models import MessageModel, ThreadModel
+from .models import MessageModel, RateLimitBucketModel, ThreadModel, UsageModel
 
 
 class ThreadCRUD:
@@ -29,18 +32,51 @@ class ThreadCRUD:
 
         return self._model_to_entity(thread_model, include_messages=False)
 
-    async def get_thread_by_id(self, thread_id: UUID) -> Thread | None:
-        result = await self._session.execute(
-            select(ThreadModel)
-            .options(selectinload(ThreadModel.messages))
-            .where(ThreadModel.id == str(thread_id))
-        )
+    async def get_thread_by_id(
+        self, thread_id: UUID, include_messages: bool = True
+    ) -> Thread | None:
+        query = select(ThreadModel).where(ThreadModel.id == str(thread_id))
+        if include_messages:
+            query = query.options(selectinload(ThreadModel.messages))
+        result = await self._session.execute(query)
         thread_model = result.scalar_one_or_none()
 
         if thread_model is None:
             return None
 
-        return self._model_to_entity(thread_model, include_messages=True)
+        return self._model_to_entity(thread_model, include_messages=include_messages)
+
+    async def get_rendered_messages(
+        self,
+        thread_id: UUID,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[str]:
+        """Fetch the pre-rendered JSON arrays of a thread's messages.
+
+        Only messages created after `since` and up to `until` are returned;
+        pass the thread's `updated_at` as `until` so the result matches it
+        even if a turn commits new messages meanwhile.
+        """
+        query = (
+            select(MessageModel.rendered, MessageModel.content)
+            .where(MessageModel.thread_id == str(thread_id))
+            .order_by(MessageModel.created_at)
+        )
+        if since is not None:
+            query = query.where(MessageModel.created_at > since)
+        if until is not None:
+            query = query.where(MessageModel.created_at <= until)
+        result = await self._session.execute(query)
+
+        rendered_messages = []
+        for rendered, content in result.all():
+            if rendered is None:
+                # rows written before the rendered column existed
+                messages = ModelMessagesTypeAdapter.validate_json(content)
+                rendered = render_messages(messages)
+            rendered_messages.append(rendered)
+        return rendered_messages
 
     async def get_all_threads(self) -> list[Thread]:
         result = await self._session.execute(
@@ -70,17 +106,54 @@ class ThreadCRUD:
         return self._model_to_entity(thread_model, include_messages=False)
 
     async def delete_thread(self, thread_id: UUID) -> bool:
-        result = await self._session.execute(
-            select(ThreadModel).where(ThreadModel.id == str(thread_id))
-        )
-        thread_model = result.scalar_one_or_none()
+        deleted_ids, _ = await self.delete_threads([thread_id])
+        return bool(deleted_ids)
 
-        if thread_model is None:
-            return False
+    async def delete_threads(
+        self, thread_ids: list[UUID], updated_before: datetime | None = None
+    ) -> tuple[list[UUID], int]:
+        """Bulk delete threads with their messages and usages.
 
-        await self._session.delete(thread_model)
+        With `updated_before`, threads updated since then (e.g. by a turn that
+        ran after they were selected) are kept. Returns the ids of the deleted
+        threads and the number of deleted messages.
+        """
+        if not thread_ids:
+            return [], 0
+        ids = [str(thread_id) for thread_id in thread_ids]
+        condition: ColumnElement[bool] = ThreadModel.id.in_(ids)
+        if updated_before is not None:
+            condition = condition & (ThreadModel.updated_at < updated_before)
+        doomed = select(ThreadModel.id).where(condition).scalar_subquery()
+
+        # children are deleted explicitly rather than relying on ON DELETE
+        # CASCADE, which databases created before it was added do not have;
+        # the first DELETE takes the write lock, so every statement sees the
+        # same set of threads
+        messages = await self._session.execute(
+            delete(MessageModel).where(MessageModel.thread_id.in_(doomed))
+        )
+        await self._session.execute(
+            delete(UsageModel).where(UsageModel.thread_id.in_(doomed))
+        )
+        result = await self._session.execute(
+            delete(ThreadModel).where(condition).returning(ThreadModel.id)
+        )
+        deleted_ids = [UUID(thread_id) for thread_id in result.scalars().all()]
         await self._session.commit()
-        return True
+        return deleted_ids, messages.rowcount
+
+    async def get_cold_thread_ids(
+        self, before: datetime, limit: int | None = None
+    ) -> list[UUID]:
+        """Ids of threads not updated since `before`, oldest first."""
+        result = await self._session.execute(
+            select(ThreadModel.id)
+            .where(ThreadModel.updated_at < before)
+            .order_by(ThreadModel.updated_at)
+            .limit(limit)
+        )
+        return [UUID(thread_id) for thread_id in result.scalars().all()]
 
     async def add_messages_to_thread(
         self, thread_id: UUID, messages: list[ModelMessage]
@@ -97,13 +170,17 @@ class ThreadCRUD:
 
         content = ModelMessagesTypeAdapter.dump_json(messages)
 
+        now = datetime.now()
         message_model = MessageModel(
             id=str(uuid4()),
             thread_id=str(thread_id),
             content=content,
-            created_at=datetime.now(),
+            rendered=render_messages(messages),
+            created_at=now,
         )
         thread_model.messages.append(message_model)
+        # updated_at doubles as the ETag and the `since` cursor for clients
+        thread_model.updated_at = now
 
         await self._session.commit()
         await self._session.refresh(thread_model)
@@ -127,3 +204,158 @@ class ThreadCRUD:
             updated_at=model.updated_at,
             messages=messages,
         )
+
+
+class UsageCRUD:
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    async def add_usage(self, usage: TurnUsage) -> TurnUsage:
+        usage_model = UsageModel(
+            id=str(uuid4()),
+            thread_id=str(usage.thread_id),
+            model_name=usage.model_name,
+            requests=usage.requests,
+            request_tokens=usage.request_tokens,
+            response_tokens=usage.response_tokens,
+            total_tokens=usage.total_tokens,
+            tool_calls=usage.tool_calls,
+            latency_ms=usage.latency_ms,
+            created_at=usage.created_at,
+        )
+        self._session.add(usage_model)
+        await self._session.commit()
+
+        return usage
+
+    async def get_usage_summary(
+        self,
+        thread_id: UUID | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> UsageSummary:
+        """Aggregate usage for one thread (or all threads) in a time window."""
+        query = select(
+            func.count(UsageModel.id),
+            func.coalesce(func.sum(UsageModel.requests), 0),
+            func.coalesce(func.sum(UsageModel.request_tokens), 0),
+            func.coalesce(func.sum(UsageModel.response_tokens), 0),
+            func.coalesce(func.sum(UsageModel.total_tokens), 0),
+            func.coalesce(func.sum(UsageModel.tool_calls), 0),
+            func.coalesce(func.sum(UsageModel.latency_ms), 0.0),
+        )
+        if thread_id is not None:
+            query = query.where(UsageModel.thread_id == str(thread_id))
+        if since is not None:
+            query = query.where(UsageModel.created_at >= since)
+        if until is not None:
+            query = query.where(UsageModel.created_at < until)
+
+        row = (await self._session.execute(query)).one()
+
+        return UsageSummary(
+            turns=row[0],
+            requests=row[1],
+            request_tokens=row[2],
+            response_tokens=row[3],
+            total_tokens=row[4],
+            tool_calls=row[5],
+            latency_ms=row[6],
+        )
+
+    async def get_usage_by_thread(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> dict[UUID, UsageSummary]:
+        """Aggregate usage per thread in a time window."""
+        query = select(
+            UsageModel.thread_id,
+            func.count(UsageModel.id),
+            func.sum(UsageModel.requests),
+            func.sum(UsageModel.request_tokens),
+            func.sum(UsageModel.response_tokens),
+            func.sum(UsageModel.total_tokens),
+            func.sum(UsageModel.tool_calls),
+            func.sum(UsageModel.latency_ms),
+        ).group_by(UsageModel.thread_id)
+        if since is not None:
+            query = query.where(UsageModel.created_at >= since)
+        if until is not None:
+            query = query.where(UsageModel.created_at < until)
+
+        result = await self._session.execute(query)
+
+        return {
+            UUID(row[0]): UsageSummary(
+                turns=row[1],
+                requests=row[2],
+                request_tokens=row[3],
+                response_tokens=row[4],
+                total_tokens=row[5],
+                tool_calls=row[6],
+                latency_ms=row[7],
+            )
+            for row in result.all()
+        }
+
+
+class RateLimitCRUD:
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    async def get_bucket(self, key: str) -> tuple[float, float] | None:
+        """Return the (tokens, updated_at) state of a bucket, if it exists."""
+        result = await self._session.execute(
+            select(RateLimitBucketModel.tokens, RateLimitBucketModel.updated_at).where(
+                RateLimitBucketModel.key == key
+            )
+        )
+        row = result.one_or_none()
+        return None if row is None else (row[0], row[1])
+
+    async def save_buckets(
+        self, buckets: list[tuple[str, float, float, float | None]], updated_at: float
+    ) -> bool:
+        """Store all bucket states, or none if another writer changed one first.
+
+        Each bucket is (key, tokens, full_at, expected_updated_at), with None
+        expected for a bucket that does not exist yet. Creating a bucket also
+        deletes the buckets that are full again, since a missing bucket is
+        read as a full one.
+        """
+        if any(expected is None for *_, expected in buckets):
+            keys = [key for key, *_ in buckets]
+            await self._session.execute(
+                delete(RateLimitBucketModel).where(
+                    RateLimitBucketModel.full_at <= updated_at,
+                    RateLimitBucketModel.key.not_in(keys),
+                )
+            )
+        for key, tokens, full_at, expected in buckets:
+            if expected is None:
+                self._session.add(
+                    RateLimitBucketModel(
+                        key=key, tokens=tokens, updated_at=updated_at, full_at=full_at
+                    )
+                )
+                try:
+                    await self._session.flush()
+                except IntegrityError:
+                    await self._session.rollback()
+                    return False
+                continue
+
+            result = await self._session.execute(
+                update(RateLimitBucketModel)
+                .where(
+                    RateLimitBucketModel.key == key,
+                    RateLimitBucketModel.updated_at == expected,
+                )
+                .values(tokens=tokens, updated_at=updated_at, full_at=full_at)
+            )
+            if result.rowcount == 0:
+                await self._session.rollback()
+                return False
+        await self._session.commit()
+        return True
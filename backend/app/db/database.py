@@ -1,5 +1,6 @@
 from typing import AsyncGenerator
 
+from sqlalchemy import event, inspect
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
@@ -11,6 +12,16 @@ class Base(DeclarativeBase):
 DATABASE_URL = "sqlite+aiosqlite:///./chat.db"
 
 engine = create_async_engine(DATABASE_URL, echo=True)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces ON DELETE CASCADE when foreign keys are switched on
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
 async_session_maker = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -21,6 +32,42 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def _upgrade_existing_tables(conn):
+    # create_all does not alter existing tables, so add columns and indexes
+    # introduced after a database was created
+    columns = {column["name"] for column in inspect(conn).get_columns("messages")}
+    if "rendered" not in columns:
+        conn.exec_driver_sql("ALTER TABLE messages ADD COLUMN rendered TEXT")
+    columns = {
+        column["name"] for column in inspect(conn).get_columns("rate_limit_buckets")
+    }
+    if "full_at" not in columns:
+        # 0 marks existing buckets as full, so the next insert prunes them
+        conn.exec_driver_sql(
+            "ALTER TABLE rate_limit_buckets ADD COLUMN full_at FLOAT NOT NULL DEFAULT 0"
+        )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_full_at"
+        " ON rate_limit_buckets (full_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_threads_updated_at ON threads (updated_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_thread_id ON messages (thread_id)"
+    )
+    # older code did not bump updated_at when adding messages, but it is now
+    # the upper bound of the messages a thread fetch returns
+    conn.exec_driver_sql(
+        "UPDATE threads SET updated_at = ("
+        " SELECT MAX(created_at) FROM messages WHERE thread_id = threads.id"
+        ") WHERE updated_at < ("
+        " SELECT MAX(created_at) FROM messages WHERE thread_id = threads.id"
+        ")"
+    )
+
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_existing_tables)
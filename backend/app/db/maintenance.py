@@ -0,0 +1,229 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.config.config import settings
+
+from .crud import ThreadCRUD
+from .database import async_session_maker, engine
+from .models import MessageModel, ThreadModel, UsageModel
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobMetrics:
+    """Metrics reported by a single maintenance job run."""
+
+    job: str
+    started_at: datetime
+    duration_ms: float = 0.0
+    threads: int = 0
+    messages: int = 0
+    bytes_written: int = 0
+    bytes_reclaimed: int = 0
+    error: str | None = None
+
+
+@dataclass
+class MaintenanceReport:
+    """Metrics of the latest maintenance run, one entry per job."""
+
+    jobs: list[JobMetrics] = field(default_factory=list)
+
+
+last_report = MaintenanceReport()
+
+
+async def _load_archive_records(
+    session: AsyncSession, thread_ids: list[UUID]
+) -> list[dict]:
+    ids = [str(thread_id) for thread_id in thread_ids]
+    threads = (
+        await session.execute(select(ThreadModel).where(ThreadModel.id.in_(ids)))
+    ).scalars()
+    records: dict[str, dict[str, Any]] = {
+        thread.id: {
+            "id": thread.id,
+            "title": thread.title,
+            "created_at": thread.created_at.isoformat(),
+            "updated_at": thread.updated_at.isoformat(),
+            "messages": [],
+            "usages": [],
+        }
+        for thread in threads
+    }
+    messages = await session.execute(
+        select(MessageModel.thread_id, MessageModel.created_at, MessageModel.content)
+        .where(MessageModel.thread_id.in_(ids))
+        .order_by(MessageModel.created_at)
+    )
+    for thread_id, created_at, content in messages.all():
+        if isinstance(content, bytes):
+            # written from ModelMessagesTypeAdapter.dump_json
+            content = content.decode()
+        records[thread_id]["messages"].append(
+            {"created_at": created_at.isoformat(), "content": content}
+        )
+    usages = (
+        await session.execute(select(UsageModel).where(UsageModel.thread_id.in_(ids)))
+    ).scalars()
+    for usage in usages:
+        records[usage.thread_id]["usages"].append(
+            {
+                "model_name": usage.model_name,
+                "requests": usage.requests,
+                "request_tokens": usage.request_tokens,
+                "response_tokens": usage.response_tokens,
+                "total_tokens": usage.total_tokens,
+                "tool_calls": usage.tool_calls,
+                "latency_ms": usage.latency_ms,
+                "created_at": usage.created_at.isoformat(),
+            }
+        )
+    return list(records.values())
+
+
+def _write_archives(archive_dir: Path, records: list[dict]) -> dict[str, int]:
+    """Write one gzipped JSON file per thread; returns each file's size."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    sizes = {}
+    for record in records:
+        path = archive_dir / f"{record['id']}.json.gz"
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, separators=(",", ":"))
+        # only a complete archive may replace the name the thread is deleted for
+        os.replace(tmp_path, path)
+        sizes[record["id"]] = path.stat().st_size
+    return sizes
+
+
+def _remove_archives(archive_dir: Path, thread_ids: list[str]):
+    for thread_id in thread_ids:
+        (archive_dir / f"{thread_id}.json.gz").unlink(missing_ok=True)
+
+
+async def archive_cold_threads(
+    session: AsyncSession, archive_after: timedelta
+) -> JobMetrics:
+    """Archive threads idle for `archive_after` to files and drop them."""
+    metrics = JobMetrics(job="archive", started_at=datetime.now())
+    service = ThreadCRUD(session)
+    archive_dir = Path(settings.archive_dir)
+    cutoff = datetime.now() - archive_after
+    while thread_ids := await service.get_cold_thread_ids(
+        cutoff, limit=settings.maintenance_batch_size
+    ):
+        records = await _load_archive_records(session, thread_ids)
+        sizes = await asyncio.to_thread(_write_archives, archive_dir, records)
+        # threads that got new messages after being archived stay in the
+        # hot database, and their now incomplete archives are dropped
+        deleted_ids, _ = await service.delete_threads(thread_ids, updated_before=cutoff)
+        deleted = {str(thread_id) for thread_id in deleted_ids}
+        kept = [thread_id for thread_id in sizes if thread_id not in deleted]
+        await asyncio.to_thread(_remove_archives, archive_dir, kept)
+
+        metrics.threads += len(deleted)
+        metrics.messages += sum(
+            len(record["messages"]) for record in records if record["id"] in deleted
+        )
+        metrics.bytes_written += sum(
+            size for thread_id, size in sizes.items() if thread_id in deleted
+        )
+    return metrics
+
+
+async def delete_expired_threads(
+    session: AsyncSession, retention: timedelta
+) -> JobMetrics:
+    """Delete threads idle for longer than `retention` without archiving."""
+    metrics = JobMetrics(job="retention", started_at=datetime.now())
+    service = ThreadCRUD(session)
+    cutoff = datetime.now() - retention
+    while thread_ids := await service.get_cold_thread_ids(
+        cutoff, limit=settings.maintenance_batch_size
+    ):
+        deleted_ids, messages = await service.delete_threads(
+            thread_ids, updated_before=cutoff
+        )
+        metrics.threads += len(deleted_ids)
+        metrics.messages += messages
+    return metrics
+
+
+async def vacuum_database() -> JobMetrics:
+    """Reclaim free pages and refresh planner statistics."""
+    metrics = JobMetrics(job="vacuum", started_at=datetime.now())
+    async with engine.connect() as conn:
+        # VACUUM cannot run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        size_before = await _database_size(conn)
+        await conn.exec_driver_sql("VACUUM")
+        await conn.exec_driver_sql("ANALYZE")
+        metrics.bytes_reclaimed = size_before - await _database_size(conn)
+    return metrics
+
+
+async def _database_size(conn: AsyncConnection) -> int:
+    page_count = (await conn.exec_driver_sql("PRAGMA page_count")).scalar_one()
+    page_size = (await conn.exec_driver_sql("PRAGMA page_size")).scalar_one()
+    return page_count * page_size
+
+
+async def _run_job(name: str, job) -> JobMetrics:
+    started = time.perf_counter()
+    try:
+        metrics = await job()
+    except Exception as e:
+        logger.exception(f"Maintenance job {name} failed")
+        metrics = JobMetrics(job=name, started_at=datetime.now(), error=str(e))
+    metrics.duration_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Maintenance job finished: {metrics}")
+    return metrics
+
+
+async def run_maintenance() -> MaintenanceReport:
+    """Run every enabled maintenance job once and record their metrics."""
+    global last_report
+
+    async def archive():
+        async with async_session_maker() as session:
+            return await archive_cold_threads(
+                session, timedelta(days=settings.archive_after_days)
+            )
+
+    async def retention():
+        async with async_session_maker() as session:
+            return await delete_expired_threads(
+                session, timedelta(days=settings.thread_retention_days)
+            )
+
+    report = MaintenanceReport()
+    if settings.archive_after_days is not None:
+        report.jobs.append(await _run_job("archive", archive))
+    if settings.thread_retention_days is not None:
+        report.jobs.append(await _run_job("retention", retention))
+    # VACUUM rewrites the whole file, so it only runs once rows were deleted
+    if any(metrics.threads for metrics in report.jobs):
+        report.jobs.append(await _run_job("vacuum", vacuum_database))
+    last_report = report
+    return report
+
+
+async def maintenance_loop(interval_seconds: float):
+    """Run maintenance every `interval_seconds` until cancelled."""
+    while True:
+        await run_maintenance()
+        await asyncio.sleep(interval_seconds)
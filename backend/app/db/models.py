@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, Text
+from sqlalchemy import DateTime, Float, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -12,9 +12,19 @@ class ThreadModel(Base):
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
     messages: Mapped[list["MessageModel"]] = relationship(
-        "MessageModel", back_populates="thread", cascade="all, delete-orphan"
+        "MessageModel",
+        back_populates="thread",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="MessageModel.created_at",
+    )
+    usages: Mapped[list["UsageModel"]] = relationship(
+        "UsageModel",
+        back_populates="thread",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 
@@ -23,12 +33,51 @@ class MessageModel(Base):
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     thread_id: Mapped[str] = mapped_column(
-        String(36), ForeignKey("threads.id"), nullable=False
+        String(36),
+        ForeignKey("threads.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     content: Mapped[str] = mapped_column(Text, nullable=False)
+    # role/content projection of `content`, rendered once at write time
+    rendered: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
 
     # Relationship to ThreadModel
     thread: Mapped["ThreadModel"] = relationship(
         "ThreadModel", back_populates="messages"
     )
+
+
+class UsageModel(Base):
+    __tablename__ = "usages"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    thread_id: Mapped[str] = mapped_column(
+        String(36),
+        ForeignKey("threads.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    model_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    requests: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    request_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    response_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tool_calls: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    latency_ms: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+    # Relationship to ThreadModel
+    thread: Mapped["ThreadModel"] = relationship("ThreadModel", back_populates="usages")
+
+
+class RateLimitBucketModel(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    # wall-clock epoch seconds, so buckets can be shared across workers
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+    # when the bucket is full again; past that it is equivalent to no row
+    full_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
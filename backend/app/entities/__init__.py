@@ -1,3 +1,12 @@
+from .message import MessageRole, render_messages, render_part
 from .thread import Thread
+from .usage import TurnUsage, UsageSummary
 
-__all__ = ["Thread"]
+__all__ = [
+    "MessageRole",
+    "Thread",
+    "TurnUsage",
+    "UsageSummary",
+    "render_messages",
+    "render_part",
+]
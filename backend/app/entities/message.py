@@ -0,0 +1,57 @@
+import json
+from enum import Enum
+
+from pydantic_ai.messages import ModelMessage, ModelRequestPart, ModelResponsePart
+
+
+class MessageRole(str, Enum):
+    """Enumeration for message roles in the chat system."""
+
+    SYSTEM = "system"
+    USER = "user"
+    ASSISTANT = "assistant"
+    THINKING = "thinking"
+    TOOLCALL = "tool-call"
+    TOOLRETURN = "tool-return"
+    RETRY = "retry"
+
+
+_PART_KIND_ROLES = {
+    "system-prompt": MessageRole.SYSTEM,
+    "user-prompt": MessageRole.USER,
+    "text": MessageRole.ASSISTANT,
+    "thinking": MessageRole.THINKING,
+    "tool-call": MessageRole.TOOLCALL,
+    "tool-return": MessageRole.TOOLRETURN,
+    "retry-prompt": MessageRole.RETRY,
+}
+
+
+def render_part(
+    part: ModelRequestPart | ModelResponsePart,
+) -> tuple[MessageRole, str | None]:
+    """Project a Pydantic AI message part to the role/content shown to clients."""
+    role = _PART_KIND_ROLES[part.part_kind]
+
+    content = None
+    if part.part_kind == "tool-call":
+        content = f"Tool call: {part.tool_name} with args {part.args}"
+    elif part.part_kind == "tool-return":
+        content = f"{part.tool_name}: {part.content}"
+    elif hasattr(part, "content") and part.content is not None:
+        content = str(part.content)
+
+    return role, content
+
+
+def render_messages(messages: list[ModelMessage]) -> str:
+    """Render messages to a compact JSON array of {"role", "content"} objects."""
+    return json.dumps(
+        [
+            {"role": role.value, "content": content}
+            for message in messages
+            for role, content in map(render_part, message.parts)
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
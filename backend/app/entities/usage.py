@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import UUID
+
+
+@dataclass
+class TurnUsage:
+    """Token usage and timing recorded for a single agent turn."""
+
+    thread_id: UUID
+    model_name: str | None
+    requests: int
+    request_tokens: int
+    response_tokens: int
+    total_tokens: int
+    tool_calls: int
+    latency_ms: float
+    created_at: datetime
+
+
+@dataclass
+class UsageSummary:
+    """Aggregated usage over a set of turns."""
+
+    turns: int = 0
+    requests: int = 0
+    request_tokens: int = 0
+    response_tokens: int = 0
+    total_tokens: int = 0
+    tool_calls: int = 0
+    latency_ms: float = 0.0
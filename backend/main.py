@@ -1,15 +1,27 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
-from app.api.router import router
+from app.api.router import maintenance_router, router
+from app.config.config import settings
+from app.db import maintenance
 from app.db.database import create_tables
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_tables()
+    maintenance_task = None
+    if settings.maintenance_interval_seconds is not None:
+        maintenance_task = asyncio.create_task(
+            maintenance.maintenance_loop(settings.maintenance_interval_seconds)
+        )
     yield
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await maintenance_task
 
 
 app = FastAPI(
@@ -20,6 +32,7 @@ app = FastAPI(
 )
 
 app.include_router(router, prefix="/api")
+app.include_router(maintenance_router, prefix="/api")
 
 
 @app.get("/")